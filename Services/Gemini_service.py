@@ -1,12 +1,13 @@
 # Services/Gemini_service.py
 import os
-import json
+import asyncio
 import logging
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
 from Services.Weather_service import get_weather
 from Services.Websearch_service import web_search
+from Services.History_service import get_recent_history
 
 logging.getLogger("google_genai.models").setLevel(logging.WARNING)
 logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -14,10 +15,6 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 load_dotenv()
 ENV_GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") or ""
 
-# Where main.py stores history
-CHAT_DIR = "chat_histories"
-MAX_HISTORY_MESSAGES = 20  # adjust if you want deeper memory
-
 # --- System instructions (refined Aizen persona) ---
 system_instructions = """
 You are Sōsuke Aizen from Bleach.
@@ -51,42 +48,42 @@ Goal:
 Respond exactly as Sōsuke Aizen would—calm, manipulative, in control—and keep replies natural to speak aloud.
 """
 
+# Built once: a byte-stable system prompt lets the provider reuse its cached prefix.
+# Per-session tools are layered on with model_copy() in stream_llm_response.
+_SYS_INSTR = system_instructions.strip()
+_BASE_CONFIG = types.GenerateContentConfig(system_instruction=_SYS_INSTR)
+
+# Tool call/response rounds allowed per reply; after that the model must answer in text
+MAX_TOOL_ROUNDS = 5
+
+# One client per API key so HTTP sessions are reused across turns
+_gemini_clients: dict[str, genai.Client] = {}
+
 def get_gemini_client(api_key: str | None):
-    """Return a Gemini client using provided key or .env fallback."""
+    """Return a (cached) Gemini client using provided key or .env fallback."""
     key = api_key or ENV_GEMINI_API_KEY
     if not key:
         raise ValueError("GEMINI_API_KEY missing. Provide in Settings or .env.")
-    return genai.Client(api_key=key)
+    client = _gemini_clients.get(key)
+    if client is None:
+        client = _gemini_clients[key] = genai.Client(api_key=key)
+    return client
 
-def _history_to_contents(sessionId: str):
+async def _history_to_contents(sessionId: str):
     """
-    Load last messages from disk and convert to Gemini 'contents'.
+    Take the cached last messages and convert to Gemini 'contents'.
     Maps roles: user -> 'user', agent -> 'model'.
     Returns a list of dicts in the form:
       {"role": "user"|"model", "parts": [{"text": "..."}]}
     """
     try:
-        file_path = os.path.join(CHAT_DIR, f"{sessionId}.json")
-        if not os.path.exists(file_path):
-            return []
-
-        with open(file_path, "r", encoding="utf-8") as f:
-            history = json.load(f)
-
-        history = history[-MAX_HISTORY_MESSAGES:]
-
-        contents = []
-        for msg in history:
-            role = msg.get("role", "user")
-            text = (msg.get("content") or "").strip()
-            if not text:
-                continue
-            mapped_role = "user" if role == "user" else "model"  # 'agent' -> 'model'
-            contents.append({
-                "role": mapped_role,
-                "parts": [{"text": text}],
-            })
-        return contents
+        history = await get_recent_history(sessionId)
+        # 'agent' -> 'model'; empty messages are skipped
+        return [
+            {"role": "user" if m.get("role", "user") == "user" else "model", "parts": [{"text": t}]}
+            for m in history
+            if (t := (m.get("content") or "").strip())
+        ]
     except Exception as e:
         print(f"[history] load/parse error for session={sessionId}: {e}")
         return []
@@ -103,37 +100,85 @@ async def stream_llm_response(
     Streams Gemini output. Uses persisted history if available.
     Accepts optional per-session API keys; falls back to .env if not provided.
     """
-    contents = _history_to_contents(sessionId)
+    contents = await _history_to_contents(sessionId)
 
     if not contents:
-        contents = [prompt]  # simple fallback (SDK accepts raw strings)
+        contents = [{"role": "user", "parts": [{"text": prompt}]}]
     else:
         last = contents[-1]
         if isinstance(last, dict) and last.get("role") != "user":
             contents.append({"role": "user", "parts": [{"text": prompt}]})
 
     # Build tools as closures to capture per-session keys
-    def weather_tool(location: str) -> dict:
+    async def weather_tool(location: str) -> dict:
         print(f"[Tool Call] get_weather({location})")
-        result = get_weather(location, api_key=weather_api_key)
+        result = await get_weather(location, api_key=weather_api_key)
         print(f"[Tool Response] {result}")
         return {"weather": result}
 
-    def web_search_tool(query: str) -> dict:
+    async def web_search_tool(query: str) -> dict:
         """Searches the web using Tavily."""
-        return web_search(query, api_key=websearch_api_key)
+        # Tavily's client is sync; run it in a thread so it doesn't block the loop
+        return await asyncio.to_thread(web_search, query, api_key=websearch_api_key)
+
+    tools = {fn.__name__: fn for fn in (weather_tool, web_search_tool)}
+    config = _BASE_CONFIG.model_copy(update={
+        "tools": list(tools.values()),
+        # We dispatch tool calls ourselves so a multi-tool turn runs them concurrently
+        "automatic_function_calling": types.AutomaticFunctionCallingConfig(disable=True),
+    })
+    # Last round once the tool budget is spent: tools stay declared (the history refers
+    # to them) but calling is switched off, so the model has to answer in text
+    text_only_config = config.model_copy(update={
+        "tool_config": types.ToolConfig(
+            function_calling_config=types.FunctionCallingConfig(mode="NONE"),
+        ),
+    })
 
     client = get_gemini_client(gemini_api_key)
 
-    stream = client.models.generate_content_stream(
-        model="gemini-2.5-flash",
-        contents=contents,
-        config=types.GenerateContentConfig(
-            system_instruction=system_instructions,
-            tools=[weather_tool, web_search_tool],
-        ),
-    )
-
-    for chunk in stream:
-        if hasattr(chunk, "text") and chunk.text:
-            yield chunk.text
\ No newline at end of file
+    for round_no in range(MAX_TOOL_ROUNDS + 1):
+        stream = await client.aio.models.generate_content_stream(
+            model="gemini-2.5-flash",
+            contents=contents,
+            config=text_only_config if round_no == MAX_TOOL_ROUNDS else config,
+        )
+
+        model_parts = []  # the model turn, kept so tool results can be sent back after it
+        calls = []
+        async for chunk in stream:
+            candidates = getattr(chunk, "candidates", None)
+            content = candidates[0].content if candidates else None
+            for part in (content.parts if content and content.parts else []):
+                model_parts.append(part)
+                if part.function_call:
+                    calls.append(part.function_call)
+                elif part.text and not part.thought:
+                    yield part.text
+
+        if not calls:
+            return
+        if round_no == MAX_TOOL_ROUNDS:
+            print(f"[Tool error] model still requested {[c.name for c in calls]} with tools disabled; reply ends here")
+            return
+
+        results = await asyncio.gather(*(_call_tool(tools, call) for call in calls))
+        contents.append(types.Content(role="model", parts=model_parts))
+        contents.append(types.Content(role="user", parts=[
+            types.Part.from_function_response(name=call.name, response=result)
+            for call, result in zip(calls, results)
+        ]))
+        if round_no == MAX_TOOL_ROUNDS - 1:
+            print(f"[Tool error] tool round limit ({MAX_TOOL_ROUNDS}) reached; asking for a text-only answer")
+
+
+async def _call_tool(tools: dict, call: types.FunctionCall) -> dict:
+    """Run one model-requested tool call; errors are returned to the model as a result."""
+    fn = tools.get(call.name)
+    if fn is None:
+        return {"error": f"Unknown tool: {call.name}"}
+    try:
+        return await fn(**(call.args or {}))
+    except Exception as e:
+        print(f"[Tool error] {call.name}: {e}")
+        return {"error": str(e)}
@@ -0,0 +1,112 @@
+# Services/History_service.py
+import os
+import asyncio
+import tempfile
+import threading
+from collections import deque
+from typing import Deque, Dict, List
+
+import aiofiles
+import orjson
+
+CHAT_DIR = "chat_histories"
+MAX_HISTORY_MESSAGES = 20  # adjust if you want deeper memory
+
+os.makedirs(CHAT_DIR, exist_ok=True)
+
+# Recent messages per session, kept in memory so a turn never re-reads the log
+# { session_id: deque([{"role": ..., "content": ..., "timestamp": ...}, ...]) }
+history_cache: Dict[str, Deque[dict]] = {}
+
+# Serializes legacy `.json` -> `.jsonl` migrations across executor threads
+_migrate_lock = threading.Lock()
+
+
+def history_path(session_id: str) -> str:
+    """Path of the session's append-only JSONL log."""
+    return os.path.join(CHAT_DIR, f"{session_id}.jsonl")
+
+
+def _migrate_legacy(session_id: str):
+    """Convert an old pretty-printed `{sid}.json` history into `{sid}.jsonl` once."""
+    legacy_path = os.path.join(CHAT_DIR, f"{session_id}.json")
+    if not os.path.exists(legacy_path) or os.path.exists(history_path(session_id)):
+        return
+
+    # /history and a first turn can both get here from executor threads; only one may migrate
+    with _migrate_lock:
+        if not os.path.exists(legacy_path) or os.path.exists(history_path(session_id)):
+            return
+
+        with open(legacy_path, "rb") as f:
+            history = orjson.loads(f.read())
+        # Write to a temp file first so a crash never leaves a truncated log that blocks re-migration
+        fd, tmp_path = tempfile.mkstemp(dir=CHAT_DIR, prefix=f"{session_id}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for msg in history:
+                    f.write(orjson.dumps(msg).decode() + "\n")
+            os.replace(tmp_path, history_path(session_id))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        os.remove(legacy_path)
+
+
+def _read_tail(file_path: str) -> Deque[bytes]:
+    """Return the last MAX_HISTORY_MESSAGES raw lines of a log (one executor hop per cold start)."""
+    if not os.path.exists(file_path):
+        return deque()
+    with open(file_path, "rb") as f:
+        return deque(f, maxlen=MAX_HISTORY_MESSAGES)
+
+
+async def get_recent_history(session_id: str) -> Deque[dict]:
+    """
+    Return the cached tail of a session's history.
+    On a cold start only the last MAX_HISTORY_MESSAGES lines of the log are parsed.
+    """
+    recent = history_cache.get(session_id)
+    if recent is not None:
+        return recent
+
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, _migrate_legacy, session_id)
+    tail = await loop.run_in_executor(None, _read_tail, history_path(session_id))
+    recent = deque((orjson.loads(line) for line in tail if line.strip()), maxlen=MAX_HISTORY_MESSAGES)
+
+    # Another turn may have warmed the cache while we were reading
+    return history_cache.setdefault(session_id, recent)
+
+
+async def append_message(session_id: str, message: dict):
+    """Append one message to the session log and the in-memory cache."""
+    recent = await get_recent_history(session_id)  # warm the cache before the log grows
+
+    async with aiofiles.open(history_path(session_id), "a", encoding="utf-8") as f:
+        await f.write(orjson.dumps(message).decode() + "\n")
+
+    recent.append(message)
+
+
+async def read_full_history(session_id: str) -> List[dict]:
+    """Read every message of a session from disk (used by the /history endpoint)."""
+    await asyncio.get_running_loop().run_in_executor(None, _migrate_legacy, session_id)
+    file_path = history_path(session_id)
+    if not os.path.exists(file_path):
+        return []
+    async with aiofiles.open(file_path, "rb") as f:
+        raw = await f.read()
+    return [orjson.loads(line) for line in raw.splitlines() if line.strip()]
+
+
+def _remove_files(session_id: str):
+    for file_path in (history_path(session_id), os.path.join(CHAT_DIR, f"{session_id}.json")):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+async def clear_history(session_id: str):
+    """Drop a session's cached messages and delete its log."""
+    history_cache.pop(session_id, None)
+    await asyncio.get_running_loop().run_in_executor(None, _remove_files, session_id)
@@ -1,21 +1,34 @@
 import assemblyai as aai
 import os
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 aai.settings.api_key = os.getenv("ASSEMBLY_AI_API_KEY") or ""
 
+# One transcriber (and HTTP client) per API key, reused across calls
+_transcribers: dict[str, aai.Transcriber] = {}
+_transcribers_lock = threading.Lock()
+
+
+def get_transcriber(api_key: str | None = None) -> aai.Transcriber:
+    """Return the cached Transcriber for api_key (or the .env key)."""
+    key = api_key or aai.settings.api_key
+    with _transcribers_lock:
+        transcriber = _transcribers.get(key)
+        if transcriber is None:
+            client = aai.Client(settings=aai.Settings(api_key=key))
+            transcriber = _transcribers[key] = aai.Transcriber(client=client)
+        return transcriber
+
 
 def transcribe_audio(audio_bytes: bytes, api_key: str | None = None) -> str:
     """
     Non-streaming transcription (not used by the WebSocket path right now).
     Accepts an optional api_key to override .env.
     """
-    prev_key = aai.settings.api_key
-    if api_key:
-        aai.settings.api_key = api_key
     try:
-        transcriber = aai.Transcriber()
+        transcriber = get_transcriber(api_key)
         transcript = transcriber.transcribe(audio_bytes)
         if transcript.status == "error":
             logger.error(f"AssemblyAI error: {transcript.error}")
@@ -23,7 +36,4 @@ def transcribe_audio(audio_bytes: bytes, api_key: str | None = None) -> str:
         return transcript.text
     except Exception as e:
         logger.error(f"Transcription failed: {e}")
-        raise
-    finally:
-        # Restore original key
-        aai.settings.api_key = prev_key
\ No newline at end of file
+        raise
\ No newline at end of file
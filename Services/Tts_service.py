@@ -13,9 +13,11 @@ ENV_MURF_API_KEY = os.getenv("MURF_API_KEY")
 UPLOADS_DIR = Path(__file__).resolve().parent.parent / "uploads"
 UPLOADS_DIR.mkdir(exist_ok=True)
 
-def speak(text: str, output_file: str = "stream_output.wav", api_key: str | None = None):
+def speak(text: str, output_file: str | None = None, api_key: str | None = None):
     """
-    Convert text to speech using Murf API and save audio in uploads folder.
+    Convert text to speech using Murf API and return the audio bytes.
+    If output_file is given, the audio is also saved in the uploads folder
+    (off by default: concurrent calls would otherwise share one file).
     Allows passing api_key; falls back to MURF_API_KEY from .env.
     """
     key = api_key or ENV_MURF_API_KEY
@@ -24,21 +26,16 @@ def speak(text: str, output_file: str = "stream_output.wav", api_key: str | None
 
     client = Murf(api_key=key)
 
-    file_path = UPLOADS_DIR / output_file
-
-    # Start with a clean file
-    open(file_path, "wb").close()
-
     res = client.text_to_speech.stream(
         text=text,
         voice_id="en-US-ken",
         style="Audiobook"
     )
 
-    audio_bytes = b""
-    for audio_chunk in res:
-        audio_bytes += audio_chunk
-        with open(file_path, "ab") as f:
-            f.write(audio_chunk)
+    audio_bytes = b"".join(res)
+
+    if output_file:
+        with open(UPLOADS_DIR / output_file, "wb") as f:
+            f.write(audio_bytes)
 
     return audio_bytes
\ No newline at end of file
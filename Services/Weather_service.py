@@ -1,12 +1,23 @@
 # Services/Weather_service.py
 import os
-import requests
+import asyncio
+import httpx
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
 load_dotenv()
 ENV_OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
 
-def get_weather(location: str, api_key: str | None = None):
+OPENWEATHER_URL = "http://api.openweathermap.org/data/2.5/weather"
+
+# Shared pooled client so repeated calls reuse keep-alive connections
+_client = httpx.AsyncClient(timeout=8, limits=httpx.Limits(max_keepalive_connections=10))
+
+# Successful summaries keyed by normalized location, fresh for 5 minutes
+_weather_cache: TTLCache = TTLCache(maxsize=512, ttl=300)
+_weather_locks: dict[str, asyncio.Lock] = {}
+
+async def get_weather(location: str, api_key: str | None = None):
     """
     Fetch current weather for a given location using OpenWeather API.
     Returns a short natural language summary.
@@ -16,22 +27,42 @@ def get_weather(location: str, api_key: str | None = None):
     if not key:
         return "Weather service is not configured. Missing API key."
 
+    cache_key = location.strip().lower()
+    cached = _weather_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # One in-flight fetch per location; concurrent callers wait and read the cache
+    lock = _weather_locks.setdefault(cache_key, asyncio.Lock())
+    async with lock:
+        cached = _weather_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        result, ok = await _fetch_weather(location, key)
+        if ok:
+            _weather_cache[cache_key] = result
+    if not lock.locked():
+        _weather_locks.pop(cache_key, None)
+    return result
+
+
+async def _fetch_weather(location: str, key: str):
+    """Call OpenWeather; returns (summary, ok) so only successful lookups get cached."""
     try:
-        url = (
-            f"http://api.openweathermap.org/data/2.5/weather"
-            f"?q={location}&appid={key}&units=metric"
+        resp = await _client.get(
+            OPENWEATHER_URL,
+            params={"q": location, "appid": key, "units": "metric"},
         )
-        resp = requests.get(url, timeout=8)
         data = resp.json()
 
         if resp.status_code != 200:
-            return f"Couldn't fetch weather for {location}. {data.get('message', '')}"
+            return f"Couldn't fetch weather for {location}. {data.get('message', '')}", False
 
         weather_desc = data["weather"][0]["description"].capitalize()
         temp = data["main"]["temp"]
         feels_like = data["main"]["feels_like"]
 
-        return f"The weather in {location} is {weather_desc}, {temp}°C (feels like {feels_like}°C)."
+        return f"The weather in {location} is {weather_desc}, {temp}°C (feels like {feels_like}°C).", True
 
     except Exception as e:
-        return f"Error fetching weather: {str(e)}"
\ No newline at end of file
+        return f"Error fetching weather: {str(e)}", False
\ No newline at end of file
@@ -1,11 +1,39 @@
 # Services/Websearch_service.py
 import os
+import re
+import threading
 from dotenv import load_dotenv
 from tavily import TavilyClient
+from cachetools import TTLCache
 
 load_dotenv()
 ENV_TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
 
+# Keep tool output small: Gemini re-reads all of it as prompt tokens
+MAX_RESULTS = 5
+SNIPPET_CHARS = 280
+_WS = re.compile(r"\s+")
+
+# Successful results keyed by normalized query, fresh for 15 minutes
+_search_cache: TTLCache = TTLCache(maxsize=1024, ttl=900)
+_search_locks: dict[str, threading.Lock] = {}
+# TTLCache isn't thread-safe (even reads reorder it); every access to it and to _search_locks goes through this
+_search_locks_guard = threading.Lock()
+
+# One client per API key so HTTP sessions are reused across searches
+_tavily_clients: dict[str, TavilyClient] = {}
+_tavily_clients_lock = threading.Lock()
+
+
+def get_tavily_client(key: str) -> TavilyClient:
+    """Return the cached Tavily client for this key, creating it on first use."""
+    with _tavily_clients_lock:
+        client = _tavily_clients.get(key)
+        if client is None:
+            client = _tavily_clients[key] = TavilyClient(api_key=key)
+        return client
+
+
 def web_search(query: str, api_key: str | None = None) -> dict:
     """
     Perform a Tavily web search.
@@ -13,24 +41,53 @@ def web_search(query: str, api_key: str | None = None) -> dict:
     Accepts optional api_key; falls back to .env if not provided.
     """
     print(f"[Tool Call] web_search({query})")
-    try:
-        key = api_key or ENV_TAVILY_API_KEY
-        if not key:
-            return {"error": "Websearch service not configured. Missing API key."}
+    key = api_key or ENV_TAVILY_API_KEY
+    if not key:
+        return {"error": "Websearch service not configured. Missing API key."}
+
+    cache_key = query.strip().lower()
+    with _search_locks_guard:
+        cached = _search_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        lock = _search_locks.setdefault(cache_key, threading.Lock())
+
+    # One in-flight search per query; concurrent callers wait and read the cache
+    with lock:
+        with _search_locks_guard:
+            cached = _search_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        result = _search(query, key)
+        if "error" not in result:
+            with _search_locks_guard:
+                _search_cache[cache_key] = result
+    with _search_locks_guard:
+        if not lock.locked():
+            _search_locks.pop(cache_key, None)
+    return result
 
-        client = TavilyClient(api_key=key)
-        response = client.search(query)
+
+def _search(query: str, key: str) -> dict:
+    try:
+        client = get_tavily_client(key)
+        response = client.search(
+            query,
+            max_results=MAX_RESULTS,
+            search_depth="basic",
+            include_answer=True,
+        )
         results = []
 
-        for item in response.get("results", []):
+        for item in response.get("results", [])[:MAX_RESULTS]:
             results.append({
                 "title": item.get("title"),
                 "url": item.get("url"),
-                "content": item.get("content"),
+                "snippet": _WS.sub(" ", item.get("content") or "").strip()[:SNIPPET_CHARS],
             })
 
         print(f"[Tool Response] {results[:2]} ...")  # log preview
-        return {"results": results}
+        return {"answer": response.get("answer"), "results": results}
 
     except Exception as e:
         print(f"[WebSearch error] {e}")
@@ -1,19 +1,28 @@
 import os
+import re
+import time
 import asyncio
-import base64
-import json
-from datetime import datetime
+import contextlib
+import functools
 from typing import Dict, Optional
 
 from fastapi import FastAPI, WebSocket
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
+import orjson
 
 from utils.logging import setup_logger
 from Routes.transcriber import AssemblyAIStreamingTranscriber
 from Services.Gemini_service import stream_llm_response
 from Services.Tts_service import speak  # uses Murf SDK wrapper
+from Services.History_service import (
+    history_cache,
+    append_message,
+    read_full_history,
+    clear_history,
+)
 
 app = FastAPI()
 
@@ -26,41 +35,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class SSEAwareGZipMiddleware(GZipMiddleware):
+    """GZip, except for the /stream SSE endpoint: compressing it would buffer events."""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/stream":
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# Compress larger JSON responses (e.g. long /history logs)
+app.add_middleware(SSEAwareGZipMiddleware, minimum_size=1024)
+
 setup_logger()
 
 # Simple in-memory store for per-session API keys
 # Keys example: { "gemini_api_key": "...", "stt_api_key": "...", "tts_api_key": "...", "weather_api_key": "...", "websearch_api_key": "..." }
 app.state.session_configs: Dict[str, Dict[str, str]] = {}
 
+# Recent chat messages per session (shared with the Gemini service for prompt history)
+app.state.history_cache = history_cache
+
 OUTPUT_DIR = os.path.join("Agent", "Output")
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-CHAT_DIR = "chat_histories"
-os.makedirs(CHAT_DIR, exist_ok=True)
-
 
-def save_chat_message(session_id: str, role: str, content: str):
-    """Append a chat message to the session's JSON file."""
-    file_path = os.path.join(CHAT_DIR, f"{session_id}.json")
-
-    # Load existing history
-    if os.path.exists(file_path):
-        with open(file_path, "r", encoding="utf-8") as f:
-            history = json.load(f)
-    else:
-        history = []
-
-    # Append new message
-    history.append({
+async def save_chat_message(session_id: str, role: str, content: str):
+    """Append a chat message to the session's JSONL log and in-memory cache."""
+    await append_message(session_id, {
         "role": role,
         "content": content,
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": time.time(),  # epoch seconds; readers format as needed
     })
 
-    # Save back
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(history, f, ensure_ascii=False, indent=2)
-
 
 # ----- Config endpoints (UI posts keys here) -----
 class ConfigPayload(BaseModel):
@@ -96,63 +104,206 @@ async def clear_config(session_id: str):
     return {"status": "cleared", "session_id": session_id}
 
 
-# --- update stream_llm_and_tts to use session keys and save AGENT replies ---
-async def stream_llm_and_tts(final_text: str, websocket: WebSocket, session_id: str, session_keys: Optional[Dict[str, str]] = None):
-    full_reply = []
+async def send_ws_json(websocket: WebSocket, payload: dict):
+    """Send a JSON text frame, serialized with orjson (Starlette's send_json uses stdlib json)."""
+    await websocket.send_text(orjson.dumps(payload).decode())
 
-    # Stream Gemini with per-session keys (fallback to .env inside the service if missing)
-    async for chunk_text in stream_llm_response(
-        prompt=final_text,
-        sessionId=session_id,
-        gemini_api_key=(session_keys or {}).get("gemini_api_key"),
-        weather_api_key=(session_keys or {}).get("weather_api_key"),
-        websearch_api_key=(session_keys or {}).get("websearch_api_key"),
-    ):
-        if not chunk_text:
-            continue
 
-        # Send chunk to frontend (for live streaming effect)
-        await websocket.send_json({"type": "llm", "text": chunk_text})
-        full_reply.append(chunk_text)
+async def _ws_sender(queue: asyncio.Queue, websocket: WebSocket):
+    """Coalesce queued LLM text into one WS frame per LLM_FLUSH_INTERVAL window."""
+    done = False
+    while not done:
+        pending = [await queue.get()]
+        try:
+            while True:
+                pending.append(queue.get_nowait())
+        except asyncio.QueueEmpty:
+            pass
 
-        # TTS for the chunk, using per-session key if provided (fallback to .env inside service)
+        if pending[-1] is None:  # sentinel is always the last item put
+            done = True
+            pending.pop()
+        if pending:
+            await send_ws_json(websocket, {"type": "llm", "text": "".join(pending)})
+        if not done:
+            await asyncio.sleep(LLM_FLUSH_INTERVAL)
+
+
+async def _tts_worker(queue: asyncio.Queue, websocket: WebSocket, tts_key: Optional[str]):
+    """Consume reply text from the queue and send Murf audio, overlapping with the LLM stream."""
+    loop = asyncio.get_running_loop()
+    seq = 0
+    while True:
+        text = await queue.get()
+        if text is None:
+            break
+
+        # TTS for the chunk, using per-session key if provided (fallback to .env inside service).
+        # Only Murf failures are reported and skipped; a failed send means the client is gone,
+        # so it propagates and ends the worker.
         try:
-            audio_bytes = speak(chunk_text, api_key=(session_keys or {}).get("tts_api_key"))
-            if audio_bytes:
-                audio_b64 = base64.b64encode(audio_bytes).decode("utf-8")
-                await websocket.send_json({"type": "audio", "b64": audio_b64})
+            audio_bytes = await loop.run_in_executor(None, functools.partial(speak, text, api_key=tts_key))
         except Exception as tts_err:
-            await websocket.send_json({
+            await send_ws_json(websocket, {
                 "type": "error",
                 "message": f"Murf TTS error on chunk: {tts_err}"
             })
+            continue
+
+        if audio_bytes:
+            # JSON header, then the raw audio as the next binary frame (no base64)
+            await send_ws_json(websocket, {"type": "audio", "seq": seq, "mime": "audio/wav", "len": len(audio_bytes)})
+            await websocket.send_bytes(audio_bytes)
+            seq += 1
+
+
+async def _put_unless_done(queue: asyncio.Queue, item, *workers: asyncio.Task) -> bool:
+    """Put item on a bounded queue, giving up if any of the workers has exited. Returns False on give-up."""
+    if any(w.done() for w in workers):
+        return False
+    put = asyncio.ensure_future(queue.put(item))
+    await asyncio.wait({put, *workers}, return_when=asyncio.FIRST_COMPLETED)
+    if not put.done():
+        put.cancel()
+        return False
+    return True
+
+
+# LLM text frames are batched into windows of this length
+LLM_FLUSH_INTERVAL = 0.02  # seconds
+
+# Flush buffered reply text to TTS at a sentence end, or once it grows long / stale
+TTS_FLUSH_CHARS = 120
+TTS_FLUSH_INTERVAL = 0.4  # seconds
+_SENT_END = re.compile(r"[.!?](?:\s|$)|\n")
+
+
+# --- update stream_llm_and_tts to use session keys and save AGENT replies ---
+async def stream_llm_and_tts(final_text: str, websocket: WebSocket, session_id: str, session_keys: Optional[Dict[str, str]] = None):
+    full_reply = []
+    pending = []
+    pending_since = time.monotonic()
+
+    # Bounded so a slow TTS backend applies backpressure to the LLM stream
+    tts_queue: asyncio.Queue = asyncio.Queue(maxsize=8)
+    tts_task = asyncio.create_task(_tts_worker(tts_queue, websocket, (session_keys or {}).get("tts_api_key")))
+
+    # Unbounded: the sender only ever lags by one flush window
+    send_queue: asyncio.Queue = asyncio.Queue()
+    send_task = asyncio.create_task(_ws_sender(send_queue, websocket))
+
+    try:
+        # Stream Gemini with per-session keys (fallback to .env inside the service if missing).
+        # aclosing() shuts the Gemini stream down as soon as we stop reading it.
+        async with contextlib.aclosing(stream_llm_response(
+            prompt=final_text,
+            sessionId=session_id,
+            gemini_api_key=(session_keys or {}).get("gemini_api_key"),
+            weather_api_key=(session_keys or {}).get("weather_api_key"),
+            websearch_api_key=(session_keys or {}).get("websearch_api_key"),
+        )) as llm_stream:
+            async for chunk_text in llm_stream:
+                # The workers only exit early when the client has disconnected
+                if tts_task.done() or send_task.done():
+                    break
+                if not chunk_text:
+                    continue
+
+                # Send chunk to frontend (for live streaming effect)
+                send_queue.put_nowait(chunk_text)
+                full_reply.append(chunk_text)
+
+                # Aggregate token fragments so Murf gets whole sentences, not one request per chunk
+                now = time.monotonic()
+                if not pending:
+                    pending_since = now  # age the buffer from its first fragment, not from TTFT
+                pending.append(chunk_text)
+                pending_joined = "".join(pending)
+                if (
+                    _SENT_END.search(pending_joined)
+                    or len(pending_joined) >= TTS_FLUSH_CHARS
+                    or now - pending_since > TTS_FLUSH_INTERVAL
+                ):
+                    if not await _put_unless_done(tts_queue, pending_joined, tts_task, send_task):
+                        break
+                    pending.clear()
+
+        # Speak whatever tail is left once the stream ends
+        tail = "".join(pending).strip()
+        if tail:
+            await _put_unless_done(tts_queue, tail, tts_task, send_task)
+    finally:
+        # Let the workers drain what is already queued, then stop
+        send_queue.put_nowait(None)
+        if send_task.done() and not tts_task.done():
+            tts_task.cancel()  # client is gone; don't synthesize what is still queued
+        await _put_unless_done(tts_queue, None, tts_task)
+        await asyncio.gather(send_task, tts_task)
 
     # ✅ After streaming is finished, save one clean agent reply
     stitched_reply = "".join(full_reply).strip()
     if stitched_reply:
-        save_chat_message(session_id, "agent", stitched_reply)
+        await save_chat_message(session_id, "agent", stitched_reply)
 
     print("\n✅ Full Gemini response:", stitched_reply)
 
 
+async def sse_gen(prompt: str, session_id: str):
+    """Text-only Gemini stream as Server-Sent Events; history is saved like the WS path."""
+    await save_chat_message(session_id, "user", prompt)
+
+    keys = app.state.session_configs.get(session_id, {})
+    full_reply = []
+    try:
+        # aclosing() closes the Gemini stream if the client disconnects and we get cancelled
+        async with contextlib.aclosing(stream_llm_response(
+            prompt=prompt,
+            sessionId=session_id,
+            gemini_api_key=keys.get("gemini_api_key"),
+            weather_api_key=keys.get("weather_api_key"),
+            websearch_api_key=keys.get("websearch_api_key"),
+        )) as llm_stream:
+            async for chunk_text in llm_stream:
+                if not chunk_text:
+                    continue
+                full_reply.append(chunk_text)
+                yield f"data: {orjson.dumps({'token': chunk_text}).decode()}\n\n"
+    except Exception as e:
+        yield f"data: {orjson.dumps({'error': str(e)}).decode()}\n\n"
+
+    stitched_reply = "".join(full_reply).strip()
+    if stitched_reply:
+        await save_chat_message(session_id, "agent", stitched_reply)
+
+    yield f"data: {orjson.dumps({'done': True}).decode()}\n\n"
+
+
+@app.get("/stream")
+async def stream_text(prompt: str, session: str = "default_session"):
+    return StreamingResponse(
+        sse_gen(prompt, session),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/history/{session_id}")
 async def get_history(session_id: str):
-    file_path = os.path.join(CHAT_DIR, f"{session_id}.json")
-    if not os.path.exists(file_path):
-        return JSONResponse(content={"history": []})
-    with open(file_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return JSONResponse(content={"history": data})
+    data = await read_full_history(session_id)
+    return ORJSONResponse(content={"history": data})
 
 
 @app.delete("/history/{session_id}")
 async def reset_history(session_id: str):
-    file_path = os.path.join(CHAT_DIR, f"{session_id}.json")
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    await clear_history(session_id)
     return JSONResponse(content={"status": "reset", "session_id": session_id})
 
 
+# Recorded audio is written in batches of this size, or at least this often
+AUDIO_FLUSH_BYTES = 64 * 1024
+AUDIO_FLUSH_INTERVAL = 0.5  # seconds
+
+
 @app.websocket("/ws/audio")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
@@ -161,17 +312,19 @@ async def websocket_endpoint(websocket: WebSocket):
     # --- Get sessionId from frontend query params ---
     session_id = websocket.query_params.get("session") or "default_session"
 
-    file_path = os.path.join(OUTPUT_DIR, "recorded_audio.webm")
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    # Raw audio is only dumped when SAVE_AUDIO=1, one file per connection
+    audio_file = None
+    if os.getenv("SAVE_AUDIO") == "1":
+        file_path = os.path.join(OUTPUT_DIR, f"{session_id}-{int(time.time())}.webm")
+        audio_file = open(file_path, "ab")
 
     loop = asyncio.get_event_loop()
 
     async def on_final_async(text: str):
         # Save USER message
-        save_chat_message(session_id, "user", text)
+        await save_chat_message(session_id, "user", text)
 
-        await websocket.send_json({"type": "final", "text": text})
+        await send_ws_json(websocket, {"type": "final", "text": text})
 
         # Re-read latest keys on each user turn (user may update settings mid-session)
         keys = app.state.session_configs.get(session_id, {})
@@ -191,20 +344,34 @@ async def websocket_endpoint(websocket: WebSocket):
         api_key=stt_key,
     )
 
+    # Batch the raw audio dump so the receive loop isn't doing a disk write per frame
+    buffer = bytearray()
+    last_flush = time.monotonic()
+
     try:
-        with open(file_path, "ab") as f:
-            while True:
-                data = await websocket.receive_bytes()
-                f.write(data)
-                transcriber.stream_audio(data)
+        while True:
+            data = await websocket.receive_bytes()
+            transcriber.stream_audio(data)
+            if audio_file is None:
+                continue
+
+            buffer += data
+            if len(buffer) >= AUDIO_FLUSH_BYTES or time.monotonic() - last_flush > AUDIO_FLUSH_INTERVAL:
+                await asyncio.to_thread(audio_file.write, bytes(buffer))
+                buffer.clear()
+                last_flush = time.monotonic()
 
     except Exception as e:
         print(f"⚠️ WebSocket connection closed: {e}")
         try:
-            await websocket.send_json({"type": "info", "message": "WebSocket closed"})
+            await send_ws_json(websocket, {"type": "info", "message": "WebSocket closed"})
         except Exception:
             pass
 
     finally:
         transcriber.close()
-        print(f"✅ Audio saved at {file_path}")
+        if audio_file is not None:
+            if buffer:
+                await asyncio.to_thread(audio_file.write, bytes(buffer))
+            audio_file.close()
+            print(f"✅ Audio saved at {file_path}")